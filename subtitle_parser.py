@@ -1,5 +1,7 @@
 import argparse
-import codecs
+import array
+import io
+import itertools
 import os.path
 import re
 import sys
@@ -10,7 +12,7 @@ __version__ = '2.0.1'
 
 
 __all__ = [
-    'SubtitleError', 'Subtitle',
+    'SubtitleError', 'Subtitle', 'SubtitleColumns',
     'SrtParser', 'WebVttParser',
     'render_html', 'render_csv',
 ]
@@ -20,17 +22,54 @@ class SubtitleError(ValueError):
     """Invalid subtitle file"""
 
 
+_RE_NAME = re.compile(r'(\d+) "(.+)"')
+# Single timestamp, only used by SrtParser.decode_timestamp()
+_RE_TIMESTAMP = re.compile(
+    r'^([0-9]+)?:([0-9][0-9]):([0-9][0-9])[,.]([0-9][0-9][0-9])$',
+)
+# Both timestamps in one go, so a cue only needs a single match
+_RE_FULL_TIMESTAMPS = re.compile(
+    r'^([0-9]+)?:([0-9][0-9]):([0-9][0-9])[,.]([0-9][0-9][0-9])'
+    + r' --> '
+    + r'([0-9]+)?:([0-9][0-9]):([0-9][0-9])[,.]([0-9][0-9][0-9])$',
+)
+_match_name = _RE_NAME.match
+_match_full_timestamps = _RE_FULL_TIMESTAMPS.match
+
+# Values of the fixed-width timestamp fields, a dict lookup is cheaper than
+# calling int() on them
+_FIELD_VALUES = {'{0:02}'.format(i): i for i in range(100)}
+_FIELD_VALUES.update(('{0:03}'.format(i), i) for i in range(1000))
+
+
+def _timestamps_from_match(m):
+    # Get start and end from a match of _RE_FULL_TIMESTAMPS, raises
+    # ValueError if the hours have too many digits for int()
+    h1, m1, s1, ms1, h2, m2, s2, ms2 = m.groups('0')
+    values = _FIELD_VALUES
+    start = (
+        ((int(h1) * 60 + values[m1]) * 60 + values[s1]) * 1000
+        + values[ms1]
+    )
+    end = (
+        ((int(h2) * 60 + values[m2]) * 60 + values[s2]) * 1000
+        + values[ms2]
+    )
+    return start, end
+
+
 def format_timestamp(ts, *, sep='.'):
-    return '{0:02}:{1:02}:{2:02}{sep}{3:03}'.format(
-        ts // (60 * 60 * 1000),
-        (ts // (60 * 1000)) % 60,
-        (ts // 1000) % 60,
-        ts % 1000,
-        sep=sep,
+    hours, rest = divmod(ts, 3600000)
+    minutes, rest = divmod(rest, 60000)
+    seconds, milliseconds = divmod(rest, 1000)
+    return '%02d:%02d:%02d%s%03d' % (
+        hours, minutes, seconds, sep, milliseconds,
     )
 
 
 class Subtitle(object):
+    __slots__ = ('number', 'name', 'start', 'end', 'text')
+
     def __init__(self, number, start, end, text, *, name=None):
         self.number = number
         self.name = name
@@ -63,22 +102,101 @@ class Subtitle(object):
         )
 
 
+class SubtitleColumns(object):
+    """Compact storage for many subtitles
+
+    Timestamps are kept in arrays of 64-bit integers instead of one object
+    per value. Iterating or indexing gives Subtitle objects, so this can be
+    passed to the render functions.
+    """
+
+    def __init__(self, subtitles=()):
+        self.numbers = []
+        self.names = []
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+        self.texts = []
+        self.extend(subtitles)
+
+    def append(self, subtitle):
+        self.numbers.append(subtitle.number)
+        self.names.append(subtitle.name)
+        self.starts.append(subtitle.start)
+        self.ends.append(subtitle.end)
+        self.texts.append(subtitle.text)
+
+    def extend(self, subtitles):
+        for subtitle in subtitles:
+            self.append(subtitle)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Subtitle(
+            self.numbers[index], self.starts[index], self.ends[index],
+            self.texts[index],
+            name=self.names[index],
+        )
+
+    def __iter__(self):
+        for number, name, start, end, text in zip(
+            self.numbers, self.names, self.starts, self.ends, self.texts,
+        ):
+            yield Subtitle(number, start, end, text, name=name)
+
+    def to_list(self):
+        return list(self)
+
+
 class SrtParser(object):
     number_required = True
 
-    _re_timestamps = re.compile(
-        r'^(.*) --> (.*)$',
-    )
-    _re_timestamp = re.compile(
-        r'^([0-9]+)?:([0-9][0-9]):([0-9][0-9])[,.]([0-9][0-9][0-9])$',
-    )
-
     def __init__(self, fileobj):
         self.fileobj = fileobj
         self.lineno = 0
-        self._next_line = None
         self.subtitles = []
         self.warnings = []
+        self._previous = None
+        # Repeated names and texts, so they can share a single copy
+        self._strings = {}
+        # Read on first use, so errors come from parsing like they used to
+        self._lines = None
+        self._nb_lines = 0
+
+    def _load_lines(self):
+        self._lines = self._read_lines(self.fileobj)
+        self._nb_lines = len(self._lines)
+
+    @staticmethod
+    def _read_lines(fileobj):
+        # Read everything at once, the parser then only indexes into a list
+        if isinstance(fileobj, io.StringIO):
+            # Already decoded, read it in one go. Lines end where iterating
+            # the StringIO would end them, so only on LF
+            text = fileobj.read()
+            lines = text.split('\n')
+            if lines[-1] == '':
+                lines.pop()
+            if '\r' in text:
+                lines = [line.rstrip('\r') for line in lines]
+            return lines
+
+        # Lines are pulled from the file rather than using read() so that we
+        # know roughly where the error is if the data can't be decoded. Keep
+        # them as the file splits them, they might not have line endings
+        lines = []
+        try:
+            lines.extend(fileobj)
+        except UnicodeDecodeError as e:
+            raise SubtitleError(
+                "Invalid unicode in subtitles near line {lineno}".format(
+                    lineno=len(lines) + 1,
+                ),
+            ) from e
+        return [line.rstrip('\r\n') for line in lines]
 
     def print_warnings(self, fileobj=sys.stderr):
         try:
@@ -98,24 +216,47 @@ class SrtParser(object):
             )
 
     def parse(self):
-        # Skip blank lines
-        while self.next_line() == '':
-            self.read_line()
+        self.subtitles.extend(self.parse_iter())
+
+    def parse_iter(self):
+        """Parse the file, yielding subtitles as they are read
+
+        Unlike parse(), this doesn't keep them in the subtitles list.
+        """
+        self.skip_blank_lines()
 
         # Read subtitles
-        while self.parse_subtitle():
-            pass
+        read_subtitle = self.read_subtitle
+        subtitle = read_subtitle()
+        while subtitle is not None:
+            yield subtitle
+            subtitle = read_subtitle()
 
     def parse_subtitle(self):
+        subtitle = self.read_subtitle()
+        if subtitle is None:
+            return False
+        self.subtitles.append(subtitle)
+        return True
+
+    def read_subtitle(self):
+        if self._lines is None:
+            self._load_lines()
+        subtitle = self._read_subtitle_fast()
+        if subtitle is not None:
+            return subtitle
+
         # Read subtitle number
         line = self.next_line()
         name = None
         if line is None:
-            return False
-        line_with_name = re.match(r'(\d+) "(.+)"', line)
+            return None
+        line_with_name = _match_name(line)
         if line_with_name is not None:
             line = line_with_name.group(1)
+            # Speaker names repeat a lot, share a single copy
             name = line_with_name.group(2)
+            name = self._strings.setdefault(name, name)
         if '-->' not in line:
             self.read_line()
             try:
@@ -126,23 +267,7 @@ class SrtParser(object):
                         lineno=self.lineno,
                     ),
                 )
-
-            prev_subtitle_number = 0
-            if self.subtitles:
-                prev_subtitle_number = self.subtitles[-1].number
-            if prev_subtitle_number is None:
-                self.warning(
-                    "Subtitle numbers (re)starts line {lineno}".format(
-                        lineno=self.lineno + 1,
-                    ),
-                )
-            elif subtitle_number != prev_subtitle_number + 1:
-                self.warning(
-                    "Subtitle number is {actual}, expected {expected}".format(
-                        actual=subtitle_number,
-                        expected=prev_subtitle_number + 1,
-                    ),
-                )
+            self._check_number(subtitle_number)
         elif self.number_required:
             raise SubtitleError(
                 "Missing subtitle number line {lineno}".format(
@@ -150,69 +275,165 @@ class SrtParser(object):
                 ),
             )
         else:
-            if self.subtitles and self.subtitles[-1].number is not None:
-                self.warning("Subtitle numbers stop line {lineno}".format(
-                    lineno=self.lineno + 1,
-                ))
+            self._check_no_number()
             subtitle_number = None
 
         # Read timestamps
         start, end = self.parse_timestamps()
 
-        # Read lines
-        first_line_lineno = self.lineno
-        lines = []
-        line = self.read_line()
-        while line:
-            lines.append(line)
-            line = self.read_line()
-        if not lines:
+        return self._read_content(subtitle_number, start, end, name)
+
+    def _read_subtitle_fast(self):
+        # Shortcut for well-formed cues, which tries each pattern at most
+        # once per line. Returns None if anything looks different, so the
+        # general code above can handle it and report errors
+        lines = self._lines
+        lineno = self.lineno
+        if lineno + 1 >= self._nb_lines:
+            return None
+        line = lines[lineno]
+        name = None
+        if line.isdecimal():
+            try:
+                subtitle_number = int(line)
+            except ValueError:
+                # Too many digits, let the general code report it
+                return None
+        else:
+            m = _match_full_timestamps(line)
+            if m is not None:
+                # Timestamps first, no subtitle number
+                if self.number_required or not lines[lineno + 1]:
+                    return None
+                try:
+                    start, end = _timestamps_from_match(m)
+                except ValueError:
+                    return None
+                self._check_no_number()
+                self.lineno = lineno + 1
+                return self._read_content(None, start, end, None)
+            m = _match_name(line)
+            if m is None:
+                return None
+            try:
+                subtitle_number = int(m.group(1))
+            except ValueError:
+                return None
+            name = m.group(2)
+            name = self._strings.setdefault(name, name)
+
+        if lineno + 2 >= self._nb_lines:
+            return None
+        m = _match_full_timestamps(lines[lineno + 1])
+        if m is None or not lines[lineno + 2]:
+            return None
+        try:
+            start, end = _timestamps_from_match(m)
+        except ValueError:
+            return None
+        # Only go through the numbering checks if this isn't simply the
+        # next number
+        previous = self._previous
+        if (
+            previous is None
+            or previous.number is None
+            or subtitle_number != previous.number + 1
+        ):
+            self.lineno = lineno + 1
+            self._check_number(subtitle_number)
+        self.lineno = lineno + 2
+        return self._read_content(subtitle_number, start, end, name)
+
+    def _check_number(self, subtitle_number):
+        prev_subtitle_number = 0
+        if self._previous is not None:
+            prev_subtitle_number = self._previous.number
+        if prev_subtitle_number is None:
+            self.warning(
+                "Subtitle numbers (re)starts line {lineno}".format(
+                    lineno=self.lineno + 1,
+                ),
+            )
+        elif subtitle_number != prev_subtitle_number + 1:
+            self.warning(
+                "Subtitle number is {actual}, expected {expected}".format(
+                    actual=subtitle_number,
+                    expected=prev_subtitle_number + 1,
+                ),
+            )
+
+    def _check_no_number(self):
+        if self._previous is not None and self._previous.number is not None:
+            self.warning("Subtitle numbers stop line {lineno}".format(
+                lineno=self.lineno + 1,
+            ))
+
+    def _read_content(self, subtitle_number, start, end, name):
+        # Read lines, up to the next blank line
+        first = self.lineno
+        try:
+            last = self._lines.index('', first)
+        except ValueError:
+            last = self._nb_lines
+        if last == first:
             raise SubtitleError(
                 "No content in subtitle line {lineno}".format(
-                    lineno=first_line_lineno,
+                    lineno=first,
                 ),
             )
+        self.lineno = last
+        if last == first + 1:
+            text = self._lines[first]
+            # Short lines like '- Yes.' or '[Music]' come up a lot, share them
+            if len(text) < 64:
+                text = self._strings.setdefault(text, text)
+        else:
+            text = '\n'.join(self._lines[first:last])
 
-        self.subtitles.append(Subtitle(
+        subtitle = Subtitle(
             subtitle_number, start, end,
-            '\n'.join(lines),
+            text,
             name=name,
-        ))
+        )
+        self._previous = subtitle
 
         self.skip_blank_lines()
 
-        return True
+        return subtitle
 
     def skip_blank_lines(self):
-        line = self.next_line()
-        while line == '':
-            self.read_line()
-            line = self.next_line()
+        if self._lines is None:
+            self._load_lines()
+        lines = self._lines
+        nb_lines = self._nb_lines
+        lineno = self.lineno
+        while lineno < nb_lines and lines[lineno] == '':
+            lineno += 1
+        self.lineno = lineno
 
     def decode_timestamp(self, s):
-        m = self._re_timestamp.match(s)
+        # Not used by the parser anymore, kept for API compatibility
+        m = _RE_TIMESTAMP.match(s)
         if not m:
             raise SubtitleError(
                 "Invalid timestamp line {lineno}".format(
                     lineno=self.lineno,
                 ),
             )
+        hours, minutes, seconds, milliseconds = m.groups('0')
         try:
-            hours = m.group(1)
-            if hours:
-                hours = int(hours)
-            else:
-                hours = 0
-            minutes = int(m.group(2))
-            seconds = int(m.group(3))
-            milliseconds = int(m.group(4))
+            hours = int(hours)
         except ValueError:
             raise SubtitleError(
                 "Invalid timestamp line {lineno}".format(
                     lineno=self.lineno,
                 ),
             )
-        return ((hours * 60 + minutes) * 60 + seconds) * 1000 + milliseconds
+        values = _FIELD_VALUES
+        return (
+            ((hours * 60 + values[minutes]) * 60 + values[seconds]) * 1000
+            + values[milliseconds]
+        )
 
     def parse_timestamps(self):
         line = self.read_line()
@@ -222,53 +443,44 @@ class SrtParser(object):
                     lineno=self.lineno,
                 ),
             )
-        m = self._re_timestamps.match(line)
+        m = _match_full_timestamps(line)
         if not m:
+            if ' --> ' in line:
+                # The separator is there, one of the timestamps is wrong
+                raise SubtitleError(
+                    "Invalid timestamp line {lineno}".format(
+                        lineno=self.lineno,
+                    ),
+                )
             raise SubtitleError(
                 "Invalid timestamps line {lineno}".format(
                     lineno=self.lineno,
                 ),
             )
-        ts = m.groups()
-        ts = (self.decode_timestamp(s) for s in ts)
-        start, end = ts
-        return start, end
-
-    def read_line(self):
         try:
-            if self._next_line is None:
-                try:
-                    line = next(self.fileobj)
-                except StopIteration:
-                    return None
-            else:
-                line = self._next_line
-                try:
-                    self._next_line = next(self.fileobj)
-                except StopIteration:
-                    self._next_line = None
-        except UnicodeDecodeError as e:
+            return _timestamps_from_match(m)
+        except ValueError:
             raise SubtitleError(
-                "Invalid unicode in subtitles near line {lineno}".format(
-                    lineno=self.lineno + 1,
+                "Invalid timestamp line {lineno}".format(
+                    lineno=self.lineno,
                 ),
-            ) from e
+            )
+
+    def read_line(self):
+        if self._lines is None:
+            self._load_lines()
+        if self.lineno >= self._nb_lines:
+            return None
+        line = self._lines[self.lineno]
         self.lineno += 1
-        return line.rstrip('\r\n')
+        return line
 
     def next_line(self):
-        if self._next_line is None:
-            try:
-                self._next_line = next(self.fileobj)
-            except StopIteration:
-                return None
-            except UnicodeDecodeError as e:
-                raise SubtitleError(
-                    "Invalid unicode in subtitles near line {lineno}".format(
-                        lineno=self.lineno + 1,
-                    ),
-                ) from e
-        return self._next_line.rstrip('\r\n')
+        if self._lines is None:
+            self._load_lines()
+        if self.lineno >= self._nb_lines:
+            return None
+        return self._lines[self.lineno]
 
     def warning(self, message, *, lineno=None):
         if lineno is None:
@@ -279,7 +491,7 @@ class SrtParser(object):
 class WebVttParser(SrtParser):
     number_required = False
 
-    def parse(self):
+    def parse_iter(self):
         # Expect 'WEBVTT' on first line
         line = self.read_line()
         if line is None:
@@ -287,19 +499,19 @@ class WebVttParser(SrtParser):
         if not line.startswith('WEBVTT'):
             raise SubtitleError("First line doesn't start with 'WEBVTT'")
 
-        super(WebVttParser, self).parse()
+        yield from super(WebVttParser, self).parse_iter()
 
-    def parse_subtitle(self):
+    def read_subtitle(self):
         line = self.next_line()
 
-        # Skip comments
-        if line is None:
-            return False
-        elif line.startswith('NOTE ') or line == 'STYLE':
+        # Skip comments, checking the first character rules out most lines
+        while line is not None and line[:1] in 'NS' and (
+            line.startswith('NOTE ') or line == 'STYLE'
+        ):
             self.skip_until_blank_line()
-            return True
+            line = self.next_line()
 
-        return super(WebVttParser, self).parse_subtitle()
+        return super(WebVttParser, self).read_subtitle()
 
     def skip_until_blank_line(self):
         line = self.next_line()
@@ -309,21 +521,34 @@ class WebVttParser(SrtParser):
         self.skip_blank_lines()
 
 
+def _write_batched(file_out, strings, batch_size=4096):
+    # Join the output of many subtitles into a single write() call
+    strings = iter(strings)
+    batch = list(itertools.islice(strings, batch_size))
+    while batch:
+        file_out.write(''.join(batch))
+        batch = list(itertools.islice(strings, batch_size))
+
+
 def render_html(subtitles, file_out, *, show_name=None):
     import html
 
-    for subtitle in subtitles:
-        name = ''
-        if show_name is not False and subtitle.name:
-            name = html.escape(subtitle.name) + ': '
-        print(
-            "<p>{ts} {name}{text}</p>".format(
-                ts=format_timestamp(subtitle.start),
+    escape = html.escape
+    fmt = format_timestamp
+    show_name = show_name is not False
+
+    def render():
+        for subtitle in subtitles:
+            name = ''
+            if show_name and subtitle.name:
+                name = escape(subtitle.name) + ': '
+            yield "<p>{ts} {name}{text}</p>\n".format(
+                ts=fmt(subtitle.start),
                 name=name,
-                text=html.escape(subtitle.text).replace('\n', '<br>'),
-            ),
-            file=file_out,
-        )
+                text=escape(subtitle.text).replace('\n', '<br>'),
+            )
+
+    _write_batched(file_out, render())
 
 
 def render_csv(subtitles, file_out, *, show_name=None):
@@ -335,35 +560,59 @@ def render_csv(subtitles, file_out, *, show_name=None):
         + (['name'] if show_name else [])
         + ['text']
     )
-    for subtitle in subtitles:
-        writer.writerow(
-            [
-                format_timestamp(subtitle.start),
-                format_timestamp(subtitle.end),
-            ]
-            + ([subtitle.name] if show_name else [])
-            + [
-                subtitle.text,
-            ]
+    fmt = format_timestamp
+    if show_name:
+        rows = (
+            (
+                fmt(subtitle.start), fmt(subtitle.end),
+                subtitle.name, subtitle.text,
+            )
+            for subtitle in subtitles
+        )
+    else:
+        rows = (
+            (fmt(subtitle.start), fmt(subtitle.end), subtitle.text)
+            for subtitle in subtitles
         )
+    writer.writerows(rows)
 
 
 def render_srt(subtitles, file_out, *, show_name=None):
-    for number, subtitle in enumerate(subtitles, 1):
-        if show_name is not False and subtitle.name:
-            name = '[{0}]\n'.format(subtitle.name)
-        else:
-            name = ''
-        print(
-            '{number}\n{start} --> {end}\n{name}{text}\n'.format(
+    fmt = format_timestamp
+    show_name = show_name is not False
+
+    def render():
+        for number, subtitle in enumerate(subtitles, 1):
+            if show_name and subtitle.name:
+                name = '[{0}]\n'.format(subtitle.name)
+            else:
+                name = ''
+            yield '{number}\n{start} --> {end}\n{name}{text}\n\n'.format(
                 number=number,
-                start=format_timestamp(subtitle.start, sep=','),
-                end=format_timestamp(subtitle.end, sep=','),
+                start=fmt(subtitle.start, sep=','),
+                end=fmt(subtitle.end, sep=','),
                 name=name,
                 text=subtitle.text,
-            ),
-            file=file_out,
+            )
+
+    _write_batched(file_out, render())
+
+
+def _decode(data, charset):
+    # Decoding everything at once is much faster than a codecs reader
+    try:
+        return data.decode(charset)
+    except UnicodeDecodeError as e:
+        # Count CRLF, CR and LF line endings, like the converter splits lines
+        start = data[:e.start].decode(charset, 'replace')
+        lineno = (
+            start.count('\n') + start.count('\r') - start.count('\r\n') + 1
         )
+        raise SubtitleError(
+            "Invalid unicode in subtitles near line {lineno}".format(
+                lineno=lineno,
+            ),
+        ) from e
 
 
 def main():
@@ -410,7 +659,8 @@ def main():
     elif not os.path.exists(args.input):
         arg_parser.error("Specified input subtitles doesn't exist")
         return
-    file_input = open(args.input, 'rb')
+    with open(args.input, 'rb') as file_input:
+        data = file_input.read()
 
     # Pick encoding
     if args.input_charset is None:
@@ -420,14 +670,11 @@ def main():
             charset = None
             print("chardet is not available", file=sys.stderr)
         else:
+            # The start of the file is plenty to detect the charset
             detector = chardet.UniversalDetector()
-            chunk = file_input.read(4096)
-            while chunk and not detector.done:
-                detector.feed(chunk)
-                chunk = file_input.read(4096)
+            detector.feed(data[:256 * 1024])
             detector.close()
             charset = detector.result['encoding']
-            file_input.seek(0, 0)
 
         if charset:
             print(
@@ -448,7 +695,6 @@ def main():
             )
     else:
         charset = args.input_charset
-    file_input = codecs.getreader(charset)(file_input)
 
     # Pick output
     if not args.output:
@@ -463,23 +709,51 @@ def main():
             return
     else:
         output = args.output
-    file_output = open(output, 'w', encoding='utf-8')
+    # Only a file created by this run gets removed on error, not something
+    # like a symlink or /dev/null that was given as output
+    created_output = not os.path.lexists(output)
+    file_output = open(
+        output, 'w',
+        encoding='utf-8',
+        # The csv module does its own line endings
+        newline='' if render_func is render_csv else None,
+        buffering=1 << 20,
+    )
 
     # Parse
     if args.input.lower().endswith('.vtt'):
         parser_cls = WebVttParser
     else:
         parser_cls = SrtParser
-    parser = parser_cls(file_input)
+
+    # Write output as the subtitles get parsed
     try:
-        parser.parse()
+        text = _decode(data, charset)
+        del data
+        # Translate CRLF and CR-only line endings
+        text_input = io.StringIO(text, newline=None)
+        del text
+        parser = parser_cls(text_input)
+        # The parser keeps its own list of lines, close the StringIO to free
+        # its buffer
+        parser._load_lines()
+        text_input.close()
+        render_func(
+            parser.parse_iter(), file_output,
+            show_name=args.show_name,
+        )
     except SubtitleError:
         print(
             "Error processing {name}:".format(name=args.input),
             file=sys.stderr,
         )
         traceback.print_exc(file=sys.stderr)
+        # Don't leave truncated output behind
+        file_output.close()
+        if created_output:
+            os.remove(output)
         sys.exit(1)
+    file_output.close()
 
     # Print warnings
     for lineno, text in parser.warnings:
@@ -492,10 +766,6 @@ def main():
             file=sys.stderr,
         )
 
-    # Write output
-    render_func(parser.subtitles, file_output, show_name=args.show_name)
-    file_output.close()
-
 
 if __name__ == '__main__':
     main()
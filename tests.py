@@ -1,9 +1,12 @@
+import codecs
+import io
+import textwrap
 import unittest
 
 import re
-from subtitle_parser import SubtitleError, Subtitle, \
+from subtitle_parser import SubtitleError, Subtitle, SubtitleColumns, \
     SrtParser, WebVttParser, \
-    render_html, render_csv, render_srt
+    render_html, render_csv, render_srt, _decode
 
 
 def ts(hour, minute, second, milli):
@@ -12,9 +15,6 @@ def ts(hour, minute, second, milli):
 
 class TestSrtSubtitles(unittest.TestCase):
     def test_valid(self):
-        import io
-        import textwrap
-
         parser = SrtParser(io.StringIO(textwrap.dedent('''\
             1
             00:00:00,123 --> 00:00:03,456
@@ -34,10 +34,85 @@ class TestSrtSubtitles(unittest.TestCase):
             ),
         ])
 
-    def test_warnings(self):
-        import io
-        import textwrap
+    def test_parse_iter(self):
+        parser = SrtParser(io.StringIO(
+            '1\n00:00:00,123 --> 00:00:03,456\nHi there\n\n'
+            + '3\n00:01:04,843 --> 00:01:05,428\nBye\n'
+        ))
+        self.assertEqual(list(parser.parse_iter()), [
+            Subtitle(1, ts(0, 0, 0, 123), ts(0, 0, 3, 456), 'Hi there'),
+            Subtitle(3, ts(0, 1, 4, 843), ts(0, 1, 5, 428), 'Bye'),
+        ])
+        self.assertEqual(parser.subtitles, [])
+        self.assertEqual(parser.warnings, [
+            (5, 'Subtitle number is 3, expected 2'),
+        ])
+
+    def test_crlf(self):
+        parser = SrtParser(io.StringIO(
+            '1\r\n00:00:00,123 --> 00:00:03,456\r\nHi\r\nthere\r\n\r\n'
+            + '2\r\n00:01:04,843 --> 00:01:05,428\r\nBye\r\n'
+        ))
+        parser.parse()
+        self.assertEqual(parser.subtitles, [
+            Subtitle(1, ts(0, 0, 0, 123), ts(0, 0, 3, 456), 'Hi\nthere'),
+            Subtitle(2, ts(0, 1, 4, 843), ts(0, 1, 5, 428), 'Bye'),
+        ])
+
+    def test_cr(self):
+        text = (
+            '1\r00:00:00,123 --> 00:00:03,456\rHi\rthere\r\r'
+            + '2\r00:01:04,843 --> 00:01:05,428\rBye\r'
+        )
+        expected = [
+            Subtitle(1, ts(0, 0, 0, 123), ts(0, 0, 3, 456), 'Hi\nthere'),
+            Subtitle(2, ts(0, 1, 4, 843), ts(0, 1, 5, 428), 'Bye'),
+        ]
+
+        parser = SrtParser(io.StringIO(text, newline=None))
+        parser.parse()
+        self.assertEqual(parser.subtitles, expected)
+
+        parser = SrtParser(codecs.getreader('utf-8')(io.BytesIO(
+            text.encode('utf-8'),
+        )))
+        parser.parse()
+        self.assertEqual(parser.subtitles, expected)
+
+    def test_lone_cr(self):
+        # A StringIO only ends lines on LF, like when iterating it
+        parser = SrtParser(io.StringIO(
+            '1\n00:00:00,000 --> 00:00:01,000\nabc\r\r\ndef\n\n'
+            + '2\n00:00:02,000 --> 00:00:03,000\na\rb\n'
+        ))
+        parser.parse()
+        self.assertEqual(parser.subtitles, [
+            Subtitle(1, ts(0, 0, 0, 0), ts(0, 0, 1, 0), 'abc\ndef'),
+            Subtitle(2, ts(0, 0, 2, 0), ts(0, 0, 3, 0), 'a\rb'),
+        ])
 
+    def test_lines_iterator(self):
+        parser = SrtParser(iter([
+            '1', '00:00:00,123 --> 00:00:03,456', 'Hi', 'there', '',
+            '2', '00:01:04,843 --> 00:01:05,428', 'Bye',
+        ]))
+        parser.parse()
+        self.assertEqual(parser.subtitles, [
+            Subtitle(1, ts(0, 0, 0, 123), ts(0, 0, 3, 456), 'Hi\nthere'),
+            Subtitle(2, ts(0, 1, 4, 843), ts(0, 1, 5, 428), 'Bye'),
+        ])
+
+    def test_shared_strings(self):
+        parser = SrtParser(io.StringIO(
+            '1 "Remi"\n00:00:00,123 --> 00:00:03,456\n[Music]\n\n'
+            + '2 "Remi"\n00:01:04,843 --> 00:01:05,428\n[Music]\n'
+        ))
+        parser.parse()
+        first, second = parser.subtitles
+        self.assertIs(first.text, second.text)
+        self.assertIs(first.name, second.name)
+
+    def test_warnings(self):
         parser = SrtParser(io.StringIO(textwrap.dedent('''\
             2
             00:00:00,123 --> 00:00:03,456
@@ -64,12 +139,40 @@ class TestSrtSubtitles(unittest.TestCase):
         ])
 
     def test_wrong(self):
-        import io
-
         with self.assertRaises(SubtitleError) as err:
             SrtParser(io.StringIO('1\ntest\n')).parse()
         self.assertEqual(err.exception.args[0], 'Invalid timestamps line 2')
 
+        with self.assertRaises(SubtitleError) as err:
+            SrtParser(io.StringIO(
+                '1' * 5000 + '\n00:00:00,000 --> 00:00:01,000\nx\n',
+            )).parse()
+        self.assertEqual(
+            err.exception.args[0],
+            'Invalid subtitle number line 1',
+        )
+
+        with self.assertRaises(SubtitleError) as err:
+            SrtParser(io.StringIO(
+                '1' * 5000 + ' "a"\n00:00:00,000 --> 00:00:01,000\nx\n',
+            )).parse()
+        self.assertEqual(
+            err.exception.args[0],
+            'Invalid subtitle number line 1',
+        )
+
+        with self.assertRaises(SubtitleError) as err:
+            SrtParser(
+                io.StringIO('1\n00:00:00,123 --> 00:00:3,456\ntest\n'),
+            ).parse()
+        self.assertEqual(err.exception.args[0], 'Invalid timestamp line 2')
+
+        with self.assertRaises(SubtitleError) as err:
+            SrtParser(io.StringIO(
+                '1\n' + '1' * 5000 + ':00:00,000 --> 00:00:01,000\nx\n',
+            )).parse()
+        self.assertEqual(err.exception.args[0], 'Invalid timestamp line 2')
+
         with self.assertRaises(SubtitleError) as err:
             SrtParser(
                 io.StringIO('1\n00:00:00,123 --> 00:00:03,456\n\n'),
@@ -93,15 +196,14 @@ class TestSrtSubtitles(unittest.TestCase):
         )
 
     def test_invalid_unicode(self):
-        import codecs
-        import io
-
+        # The error comes from parse(), not from creating the parser
+        parser = SrtParser(codecs.getreader('utf-8')(io.BytesIO(
+            b'1\n00:00:00,123 --> 00:00:03,456\nHi there\n\n' * 100
+            + b'\xE9\n'
+            + b'1\n00:00:00,123 --> 00:00:03,456\nHi there\n\n' * 100
+        )))
         with self.assertRaises(SubtitleError) as err:
-            SrtParser(codecs.getreader('utf-8')(io.BytesIO(
-                b'1\n00:00:00,123 --> 00:00:03,456\nHi there\n\n' * 100
-                + b'\xE9\n'
-                + b'1\n00:00:00,123 --> 00:00:03,456\nHi there\n\n' * 100
-            ))).parse()
+            parser.parse()
         m = re.match(
             '^Invalid unicode in subtitles near line ([0-9]+)$',
             err.exception.args[0],
@@ -111,6 +213,54 @@ class TestSrtSubtitles(unittest.TestCase):
         # the exact line because it decodes big chunks at a time
         self.assertTrue(350 < int(m.group(1), 10) < 400)
 
+    def test_decode_error_line(self):
+        with self.assertRaises(SubtitleError) as err:
+            _decode(
+                b'1\n00:00:00,123 --> 00:00:03,456\nHi there\n\n'
+                + b'2\n00:00:04,000 --> 00:00:05,000\nCaf\xE9\n',
+                'utf-8',
+            )
+        self.assertEqual(
+            err.exception.args[0],
+            'Invalid unicode in subtitles near line 7',
+        )
+
+        with self.assertRaises(SubtitleError) as err:
+            _decode(
+                b'1\r00:00:00,123 --> 00:00:03,456\rHi there\r\r'
+                + b'2\r\n00:00:04,000 --> 00:00:05,000\r\nCaf\xE9\r\n',
+                'utf-8',
+            )
+        self.assertEqual(
+            err.exception.args[0],
+            'Invalid unicode in subtitles near line 7',
+        )
+
+
+class TestSubtitle(unittest.TestCase):
+    def test_slots(self):
+        subtitle = Subtitle(1, 0, 1000, 'Hi there', name='Remi')
+        self.assertFalse(hasattr(subtitle, '__dict__'))
+        with self.assertRaises(AttributeError):
+            subtitle.speaker = 'Remi'
+
+    def test_columns(self):
+        subtitles = [
+            Subtitle(1, ts(0, 0, 0, 123), ts(0, 0, 3, 456), 'Hi', name='Remi'),
+            Subtitle(None, ts(200, 1, 4, 843), ts(200, 1, 5, 428), 'Bye'),
+        ]
+        columns = SubtitleColumns(subtitles)
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(columns[1], subtitles[1])
+        self.assertEqual(columns[-1:], subtitles[-1:])
+        self.assertEqual(columns.to_list(), subtitles)
+
+        out = io.StringIO()
+        render_srt(columns, out)
+        expected = io.StringIO()
+        render_srt(subtitles, expected)
+        self.assertEqual(out.getvalue(), expected.getvalue())
+
 
 class TestRender(unittest.TestCase):
     subtitles = [
@@ -126,8 +276,6 @@ class TestRender(unittest.TestCase):
 
     @classmethod
     def call_render(cls, func, show_name):
-        import io
-
         out = io.StringIO()
         func(cls.subtitles, out, show_name=show_name)
         return out.getvalue()
@@ -158,20 +306,18 @@ class TestRender(unittest.TestCase):
         )
 
     def test_csv(self):
-        import textwrap
-
-        nonames = textwrap.dedent('''\
-            start,end,text\r
-            00:00:00.123,00:00:03.456,Hi there\r
-            00:01:04.843,00:01:05.428,"This is an example of a
-            subtitle file in SRT format"\r
-        ''')
-        names = textwrap.dedent('''\
-            start,end,name,text\r
-            00:00:00.123,00:00:03.456,Remi,Hi there\r
-            00:01:04.843,00:01:05.428,,"This is an example of a
-            subtitle file in SRT format"\r
-        ''')
+        nonames = (
+            'start,end,text\r\n'
+            + '00:00:00.123,00:00:03.456,Hi there\r\n'
+            + '00:01:04.843,00:01:05.428,"This is an example of a\n'
+            + 'subtitle file in SRT format"\r\n'
+        )
+        names = (
+            'start,end,name,text\r\n'
+            + '00:00:00.123,00:00:03.456,Remi,Hi there\r\n'
+            + '00:01:04.843,00:01:05.428,,"This is an example of a\n'
+            + 'subtitle file in SRT format"\r\n'
+        )
 
         self.assertEqual(
             self.call_render(render_csv, True),
@@ -187,8 +333,6 @@ class TestRender(unittest.TestCase):
         )
 
     def test_srt(self):
-        import textwrap
-
         nonames = textwrap.dedent('''\
             1
             00:00:00,123 --> 00:00:03,456
@@ -229,9 +373,6 @@ class TestRender(unittest.TestCase):
 
 class TestWebVttSubtitles(unittest.TestCase):
     def test_valid(self):
-        import io
-        import textwrap
-
         # From https://developer.mozilla.org/en-US/docs/Web/API/WebVTT_API
 
         parser = WebVttParser(io.StringIO(textwrap.dedent('''\
@@ -271,8 +412,6 @@ class TestWebVttSubtitles(unittest.TestCase):
         ])
 
     def test_wrong(self):
-        import io
-
         with self.assertRaises(SubtitleError) as err:
             WebVttParser(
                 io.StringIO('1\n00:00:00,123 --> 00:00:03,456\ntest\n'),
@@ -282,10 +421,14 @@ class TestWebVttSubtitles(unittest.TestCase):
             "First line doesn't start with 'WEBVTT'",
         )
 
-    def test_numbering_check(self):
-        import io
-        import textwrap
+        with self.assertRaises(SubtitleError) as err:
+            WebVttParser(io.StringIO(
+                'WEBVTT\n\n' + '1' * 5000 + ':00:00,000 --> 00:00:01,000\n'
+                + 'x\n',
+            )).parse()
+        self.assertEqual(err.exception.args[0], 'Invalid timestamp line 3')
 
+    def test_numbering_check(self):
         parser = WebVttParser(io.StringIO(textwrap.dedent('''\
             WEBVTT
 
@@ -327,9 +470,6 @@ class TestWebVttSubtitles(unittest.TestCase):
         ])
 
     def test_webex_check(self):
-        import io
-        import textwrap
-
         parser = WebVttParser(io.StringIO(textwrap.dedent('''\
             WEBVTT
 